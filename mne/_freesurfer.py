@@ -5,6 +5,7 @@
 #
 # License: BSD-3-Clause
 
+from functools import lru_cache
 import os.path as op
 import numpy as np
 from gzip import GzipFile
@@ -327,10 +328,10 @@ def vertex_to_mni(vertices, hemis, subject, subjects_dir=None, verbose=None):
              for h in ['lh', 'rh']]
 
     # read surface locations in MRI space
-    rr = [read_surface(s)[0] for s in surfs]
+    rr = [_read_surface_rr_mtime(s, op.getmtime(s)) for s in surfs]
 
     # take point locations in MRI space and convert to MNI coordinates
-    xfm = read_talxfm(subject, subjects_dir)
+    xfm = _read_talxfm_cached(subject, subjects_dir)
     xfm['trans'][:3, 3] *= 1000.  # m->mm
     data = np.array([rr[h][v, :] for h, v in zip(hemis, vertices)])
     if singleton:
@@ -416,7 +417,7 @@ def get_mni_fiducials(subject, subjects_dir=None, verbose=None):
     assert coord_frame == FIFF.FIFFV_COORD_MRI
     if subject == 'fsaverage':
         return fids  # special short-circuit for fsaverage
-    mni_mri_t = invert_transform(read_talxfm(subject, subjects_dir))
+    mni_mri_t = invert_transform(_read_talxfm_cached(subject, subjects_dir))
     for f in fids:
         f['r'] = apply_trans(mni_mri_t, f['r'])
     return fids
@@ -501,6 +502,35 @@ def read_talxfm(subject, subjects_dir=None, verbose=None):
     return mri_mni_t
 
 
+def _read_talxfm_cached(subject, subjects_dir=None):
+    """Read the MRI-to-MNI transform, reusing it while its files are intact."""
+    subjects_dir = str(get_subjects_dir(subjects_dir, raise_error=True))
+    mri_dir = op.join(subjects_dir, subject, 'mri')
+    # the transform depends on talairach.xfm and the header of orig or T1
+    mtimes = tuple(
+        op.getmtime(fname) if op.isfile(fname) else None for fname in (
+            op.join(mri_dir, 'transforms', 'talairach.xfm'),
+            op.join(mri_dir, 'orig.mgz'), op.join(mri_dir, 'T1.mgz')))
+    mri_mni_t = _read_talxfm_mtimes(subject, subjects_dir, mtimes)
+    return Transform(mri_mni_t['from'], mri_mni_t['to'],
+                     mri_mni_t['trans'].copy())
+
+
+@lru_cache(maxsize=16)
+def _read_surface_rr_mtime(fname, mtime):
+    # mtime is only used as part of the cache key; the array is shared, so
+    # make it read-only
+    rr = read_surface(fname)[0]
+    rr.flags.writeable = False
+    return rr
+
+
+@lru_cache(maxsize=16)
+def _read_talxfm_mtimes(subject, subjects_dir, mtimes):
+    # mtimes is only used as part of the cache key
+    return read_talxfm(subject, subjects_dir, verbose=False)
+
+
 def _check_mri(mri, subject, subjects_dir):
     """Check whether an mri exists in the Freesurfer subject directory."""
     _validate_type(mri, 'path-like', 'mri')
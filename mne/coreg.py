@@ -5,8 +5,10 @@
 #
 # License: BSD-3-Clause
 
+from collections import deque
 import configparser
 import fnmatch
+from functools import lru_cache
 from glob import glob, iglob
 import os
 import os.path as op
@@ -14,7 +16,6 @@ import stat
 import sys
 import re
 import shutil
-from functools import reduce
 
 import numpy as np
 
@@ -33,11 +34,13 @@ from .surface import (read_surface, write_surface, _normalize_vectors,
                       complete_surface_info, decimate_surface,
                       _DistanceQuery)
 from .bem import read_bem_surfaces, write_bem_surfaces
-from .transforms import (rotation, rotation3d, scaling, translation, Transform,
+from .transforms import (rotation, rotation3d, scaling, Transform,
                          _read_fs_xfm, _write_fs_xfm, invert_transform,
                          combine_transforms, _quat_to_euler,
-                         _fit_matched_points, apply_trans,
-                         rot_to_quat, _angle_between_quats)
+                         _euler_to_quat, _quat_mult, _fit_matched_points,
+                         apply_trans, quat_to_rot, rot_to_quat,
+                         _angle_between_quats)
+from .fixes import jit
 from .utils import (get_config, get_subjects_dir, logger, pformat, verbose,
                     warn, has_nibabel, fill_doc, _validate_type,
                     _check_subject, _check_option)
@@ -298,26 +301,26 @@ def _trans_from_params(param_info, params):
     """
     do_rotate, do_translate, do_scale = param_info
     i = 0
-    trans = []
 
+    # Fill a single 4x4 in place rather than multiplying translation,
+    # rotation and scaling matrices together (T @ R @ S)
     if do_rotate:
         x, y, z = params[:3]
-        trans.append(rotation(x, y, z))
+        trans = rotation(x, y, z)
         i += 3
+    else:
+        trans = np.eye(4)
 
     if do_translate:
-        x, y, z = params[i:i + 3]
-        trans.insert(0, translation(x, y, z))
+        trans[:3, 3] = params[i:i + 3]
         i += 3
 
+    # scaling multiplies the columns of the rotation
     if do_scale == 1:
-        s = params[i]
-        trans.append(scaling(s, s, s))
+        trans[:3, :3] *= params[i]
     elif do_scale == 3:
-        x, y, z = params[i:i + 3]
-        trans.append(scaling(x, y, z))
+        trans[:3, :3] *= params[i:i + 3]
 
-    trans = reduce(np.dot, trans)
     return trans
 
 
@@ -404,9 +407,8 @@ def fit_matched_points(src_pts, tgt_pts, rotate=True, translate=True,
 
     # assess the error of the solution
     if tol is not None:
-        src_pts = np.hstack((src_pts, np.ones((len(src_pts), 1))))
-        est_pts = np.dot(src_pts, trans.T)[:, :3]
-        err = np.sqrt(np.sum((est_pts - tgt_pts) ** 2, axis=1))
+        est_pts = apply_trans(trans, src_pts)
+        err = np.linalg.norm(est_pts - tgt_pts, axis=1)
         if np.any(err > tol):
             raise RuntimeError("Error exceeds tolerance. Error = %r" % err)
 
@@ -421,9 +423,6 @@ def fit_matched_points(src_pts, tgt_pts, rotate=True, translate=True,
 
 def _generic_fit(src_pts, tgt_pts, param_info, weights, x0):
     from scipy.optimize import leastsq
-    if param_info[1]:  # translate
-        src_pts = np.hstack((src_pts, np.ones((len(src_pts), 1))))
-
     if param_info == (True, False, 0):
         def error(x):
             rx, ry, rz = x
@@ -435,43 +434,15 @@ def _generic_fit(src_pts, tgt_pts, param_info, weights, x0):
             return d.ravel()
         if x0 is None:
             x0 = (0, 0, 0)
-    elif param_info == (True, True, 0):
-        def error(x):
-            rx, ry, rz, tx, ty, tz = x
-            trans = np.dot(translation(tx, ty, tz), rotation(rx, ry, rz))
-            est = np.dot(src_pts, trans.T)[:, :3]
-            d = tgt_pts - est
-            if weights is not None:
-                d *= weights
-            return d.ravel()
-        if x0 is None:
-            x0 = (0, 0, 0, 0, 0, 0)
-    elif param_info == (True, True, 1):
-        def error(x):
-            rx, ry, rz, tx, ty, tz, s = x
-            trans = reduce(np.dot, (translation(tx, ty, tz),
-                                    rotation(rx, ry, rz),
-                                    scaling(s, s, s)))
-            est = np.dot(src_pts, trans.T)[:, :3]
-            d = tgt_pts - est
-            if weights is not None:
-                d *= weights
-            return d.ravel()
-        if x0 is None:
-            x0 = (0, 0, 0, 0, 0, 0, 1)
-    elif param_info == (True, True, 3):
+    elif param_info in ((True, True, 0), (True, True, 1), (True, True, 3)):
         def error(x):
-            rx, ry, rz, tx, ty, tz, sx, sy, sz = x
-            trans = reduce(np.dot, (translation(tx, ty, tz),
-                                    rotation(rx, ry, rz),
-                                    scaling(sx, sy, sz)))
-            est = np.dot(src_pts, trans.T)[:, :3]
-            d = tgt_pts - est
+            trans = _trans_from_params(param_info, x)
+            d = tgt_pts - apply_trans(trans, src_pts)
             if weights is not None:
                 d *= weights
             return d.ravel()
         if x0 is None:
-            x0 = (0, 0, 0, 0, 0, 0, 1, 1, 1)
+            x0 = (0, 0, 0, 0, 0, 0) + (1,) * param_info[2]
     else:
         raise NotImplementedError(
             "The specified parameter combination is not implemented: "
@@ -481,6 +452,88 @@ def _generic_fit(src_pts, tgt_pts, param_info, weights, x0):
     return x
 
 
+@jit()
+def _point_to_plane_normal_equations(src_pts, tgt_pts, nn, weights, rot, tra,
+                                     sca, n_scale_params):
+    """Assemble the weighted normal equations of a point-to-plane step."""
+    src_pts = src_pts * sca
+    rot_t = rot.T.copy()
+    est = np.dot(src_pts, rot_t) + tra
+    nn = np.dot(nn, rot_t)
+    # columns: rotation (a x n), translation (n), scale
+    H = np.empty((len(src_pts), 6 + n_scale_params))
+    H[:, :3] = np.cross(est, nn)
+    H[:, 3:6] = nn
+    if n_scale_params == 1:
+        H[:, 6] = np.sum((est - tra) * nn, axis=1)
+    elif n_scale_params == 3:
+        H[:, 6:] = np.dot(nn, rot) * src_pts
+    r = np.sum((tgt_pts - est) * nn, axis=1)
+    H_w = H.T * weights
+    return np.dot(H_w, H), np.dot(H_w, r)
+
+
+def _anderson_extrapolate(params, updates):
+    """Combine the last fixed-point iterates with Anderson mixing.
+
+    ``params`` are the last iterates and ``updates`` the result of one plain
+    ICP step from each of them. The weights minimize the norm of the
+    combined residual ``updates - params`` and sum to one. None is returned
+    when the residuals are linearly dependent.
+    """
+    U = updates - params
+    C = U @ U.T
+    try:
+        z = np.linalg.solve(C, np.ones(len(C)))
+    except np.linalg.LinAlgError:
+        return None
+    c = z / z.sum()
+    if not np.isfinite(c).all():
+        return None
+    return c @ updates
+
+
+def _fit_point_to_plane(src_pts, tgt_pts, nn, weights, n_scale_params, x0,
+                        damping=0.):
+    """Take one linearized point-to-plane step from the parameters x0.
+
+    This minimizes the weighted squared distances between ``tgt_pts`` and the
+    planes through the transformed ``src_pts`` with normals ``nn``, using the
+    small-angle approximation of the rotation (Low, Linear Least-Squares
+    Optimization for Point-to-Plane ICP Surface Registration, 2004).
+    Scale factors are linearized as relative changes. A positive ``damping``
+    shortens the step (Levenberg), which keeps it bounded when the surface
+    barely constrains sliding along it.
+    """
+    quat = _euler_to_quat(np.array(x0[:3], float))
+    rot = quat_to_rot(quat)
+    tra = np.array(x0[3:6], float)
+    sca = np.array(x0[6:6 + n_scale_params], float)
+    if n_scale_params == 1:
+        sca = np.repeat(sca, 3)
+    elif n_scale_params == 0:
+        sca = np.ones(3)
+    HTH, HTr = _point_to_plane_normal_equations(
+        np.asarray(src_pts, float), np.asarray(tgt_pts, float),
+        np.asarray(nn, float), np.asarray(weights, float),
+        np.ascontiguousarray(rot), tra, sca, n_scale_params)
+    if damping > 0:
+        HTH.flat[::len(HTH) + 1] += damping * np.mean(np.diag(HTH))
+    x = np.linalg.solve(HTH, HTr)
+
+    # compose the small rotation and translation, keeping the rotation as a
+    # quaternion so that only the translation needs the 3x3 matrix
+    angle = np.linalg.norm(x[:3])
+    quat_delta = x[:3] * (np.sin(angle / 2.) / angle if angle > 0 else 0.5)
+    tra = np.dot(quat_to_rot(quat_delta), tra) + x[3:6]
+    params = [_quat_to_euler(_quat_mult(quat_delta, quat)), tra]
+    if n_scale_params == 1:
+        params.append(sca[:1] * (1 + x[6]))
+    elif n_scale_params == 3:
+        params.append(sca * (1 + x[6:9]))
+    return np.concatenate(params)
+
+
 def _find_label_paths(subject='fsaverage', pattern=None, subjects_dir=None):
     """Find paths to label files in a subject's label directory.
 
@@ -1120,8 +1173,12 @@ def scale_source_space(subject_to, src_name, subject_from=None, scale=None,
                 subject_to)
     logger.info("Scale factor: %s", scale)
     add_dist = False
+    # with a scale factor of exactly 1 only the subject changes
+    identity = np.all(scale == 1)
     for ss in sss:
         ss['subject_his_id'] = subject_to
+        if identity:
+            continue
         ss['rr'] *= scale
         # additional tags for volume source spaces
         for key in ('vox_mri_t', 'src_mri_t'):
@@ -1254,19 +1311,30 @@ def _scale_xfm(subject_to, xfm_fname, mri_name, subject_from, scale,
 
 
 def _read_surface(filename):
-    bem = dict()
-    if filename is not None and op.exists(filename):
-        if filename.endswith('.fif'):
-            bem = read_bem_surfaces(filename, verbose=False)[0]
-        else:
-            try:
-                bem = read_surface(filename, return_dict=True)[2]
-                bem['rr'] *= 1e-3
-                complete_surface_info(bem, copy=False)
-            except Exception:
-                raise ValueError(
-                    "Error loading surface from %s (see "
-                    "Terminal for details)." % filename)
+    if filename is None or not op.exists(filename):
+        return dict()
+    # The surface is shared between Coregistration instances, so its arrays
+    # are read-only
+    return dict(_read_surface_mtime(filename, op.getmtime(filename)))
+
+
+@lru_cache(maxsize=8)
+def _read_surface_mtime(filename, mtime):
+    # mtime is only used as part of the cache key
+    if filename.endswith('.fif'):
+        bem = read_bem_surfaces(filename, verbose=False)[0]
+    else:
+        try:
+            bem = read_surface(filename, return_dict=True)[2]
+            bem['rr'] *= 1e-3
+            complete_surface_info(bem, copy=False)
+        except Exception:
+            raise ValueError(
+                "Error loading surface from %s (see "
+                "Terminal for details)." % filename)
+    for value in bem.values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
     return bem
 
 
@@ -1339,6 +1407,15 @@ class Coregistration(object):
         self._dig_dict['rpa'] = np.array([self._dig_dict['rpa']], float)
         self._dig_dict['nasion'] = np.array([self._dig_dict['nasion']], float)
         self._dig_dict['lpa'] = np.array([self._dig_dict['lpa']], float)
+        for key in ('hsp', 'hpi', 'dig_ch_pos_location'):
+            if self._dig_dict[key] is not None:
+                self._dig_dict[key] = np.ascontiguousarray(
+                    self._dig_dict[key], float)
+        (self._transformed_dig_hpi, self._transformed_dig_eeg,
+         self._transformed_orig_dig_extra) = [
+            None if self._dig_dict[key] is None else
+            np.empty_like(self._dig_dict[key])
+            for key in ('hpi', 'dig_ch_pos_location', 'hsp')]
 
         self._setup_bem()
         self._setup_fiducials(fiducials)
@@ -1416,16 +1493,13 @@ class Coregistration(object):
             self._nasion = self._fid_points[1:2]
             self._rpa = self._fid_points[2:3]
 
-    def _update_params(self, rot=None, tra=None, sca=None,
-                       force_update_omitted=False):
-        if force_update_omitted:
-            tra = self._translation
+    def _update_params(self, rot=None, tra=None, sca=None):
         rot_changed = False
         if rot is not None:
             rot_changed = True
             self._last_rotation = self._rotation
             self._rotation = rot
-        tra_changed = False
+        tra_changed = nearest_changed = False
         if rot_changed or tra is not None:
             if tra is None:
                 tra = self._translation
@@ -1435,33 +1509,40 @@ class Coregistration(object):
             self._head_mri_t = rotation(*self._rotation).T
             self._head_mri_t[:3, 3] = \
                 -np.dot(self._head_mri_t[:3, :3], tra)
-            self._transformed_dig_hpi = \
-                apply_trans(self._head_mri_t, self._dig_dict['hpi'])
-            self._transformed_dig_eeg = \
-                apply_trans(
-                    self._head_mri_t, self._dig_dict['dig_ch_pos_location'])
-            self._transformed_dig_extra = \
-                apply_trans(self._head_mri_t,
-                            self._filtered_extra_points)
-            self._transformed_orig_dig_extra = \
-                apply_trans(self._head_mri_t, self._dig_dict['hsp'])
+            # transform in place into the buffers allocated in __init__
+            self._transformed_dig_hpi = apply_trans(
+                self._head_mri_t, self._dig_dict['hpi'],
+                out=self._transformed_dig_hpi)
+            self._transformed_dig_eeg = apply_trans(
+                self._head_mri_t, self._dig_dict['dig_ch_pos_location'],
+                out=self._transformed_dig_eeg)
+            self._transformed_orig_dig_extra = apply_trans(
+                self._head_mri_t, self._dig_dict['hsp'],
+                out=self._transformed_orig_dig_extra)
             self._mri_head_t = rotation(*self._rotation)
             self._mri_head_t[:3, 3] = np.array(tra)
         if tra_changed or sca is not None:
             if sca is None:
                 sca = self._scale
+            # the MRI points (and their tree) only depend on the scale and
+            # hair, so rotations and translations can reuse them
+            if not np.array_equal(sca, self._scale):
+                self._nearest_calc_dirty = True
             self._last_scale = self._scale
             self._scale = sca
             self._mri_trans = np.eye(4)
             self._mri_trans[:, :3] *= sca
-            self._transformed_high_res_mri_points = \
-                apply_trans(self._mri_trans,
-                            self._processed_high_res_mri_points)
-            self._update_nearest_calc()
-
-        if tra_changed:
-            self._nearest_transformed_high_res_mri_idx_orig_hsp = \
-                self._nearest_calc.query(self._transformed_orig_dig_extra)[1]
+            if self._nearest_calc_dirty:
+                self._update_nearest_calc()
+                nearest_changed = True
+
+        if tra_changed or nearest_changed:
+            # the distances are kept for omit_head_shape_points, and the
+            # indices of the filtered points are a subset of these, so they
+            # need to be updated whenever the points or the tree change
+            (self._orig_hsp_point_distance,
+             self._nearest_transformed_high_res_mri_idx_orig_hsp) = \
+                self._nearest_calc.query(self._transformed_orig_dig_extra)
             self._nearest_transformed_high_res_mri_idx_hpi = \
                 self._nearest_calc.query(self._transformed_dig_hpi)[1]
             self._nearest_transformed_high_res_mri_idx_eeg = \
@@ -1511,6 +1592,7 @@ class Coregistration(object):
             The modified Coregistration object.
         """
         self._grow_hair = value
+        self._nearest_calc_dirty = True
         self._update_params(self._rotation, self._translation, self._scale)
         return self
 
@@ -1563,15 +1645,32 @@ class Coregistration(object):
         return self
 
     def _update_nearest_calc(self):
+        self._processed_high_res_mri_points = \
+            self._get_processed_mri_points('high')
+        self._transformed_high_res_mri_points = \
+            self._processed_high_res_mri_points * self._scale
+        self._transformed_high_res_mri_nn = None
         self._nearest_calc = _DistanceQuery(
-            self._processed_high_res_mri_points * self._scale)
-
-    @property
-    def _filtered_extra_points(self):
-        if self._extra_points_filter is None:
-            return self._dig_dict['hsp']
+            self._transformed_high_res_mri_points, method='cKDTree')
+        self._nearest_calc_dirty = False
+
+    def _get_transformed_high_res_mri_nn(self):
+        # only point-to-plane ICP uses the normals, so compute them lazily
+        if self._transformed_high_res_mri_nn is None:
+            # normals transform with the inverse transpose of the scaling
+            self._transformed_high_res_mri_nn = \
+                self._bem_high_res['nn'] / self._scale
+            _normalize_vectors(self._transformed_high_res_mri_nn)
+        return self._transformed_high_res_mri_nn
+
+    def _set_extra_points_filter(self, mask):
+        # keep the selected head shape points as one contiguous array instead
+        # of re-indexing them every time they are used
+        self._extra_points_filter = mask
+        if mask is None:
+            self._filtered_extra_points = self._dig_dict['hsp']
         else:
-            return self._dig_dict['hsp'][self._extra_points_filter]
+            self._filtered_extra_points = self._dig_dict['hsp'][mask]
 
     @property
     def _parameters(self):
@@ -1593,8 +1692,10 @@ class Coregistration(object):
 
     @property
     def _nearest_transformed_high_res_mri_idx_hsp(self):
-        return self._nearest_calc.query(
-            apply_trans(self._head_mri_t, self._filtered_extra_points))[1]
+        idx = self._nearest_transformed_high_res_mri_idx_orig_hsp
+        if self._extra_points_filter is not None:
+            idx = idx[self._extra_points_filter]
+        return idx
 
     @property
     def _has_hpi_data(self):
@@ -1618,10 +1719,6 @@ class Coregistration(object):
     def _has_rpa_data(self):
         return (np.any(self._rpa) and np.any(self._dig_dict['rpa']))
 
-    @property
-    def _processed_high_res_mri_points(self):
-        return self._get_processed_mri_points('high')
-
     @property
     def _processed_low_res_mri_points(self):
         return self._get_processed_mri_points('low')
@@ -1646,17 +1743,16 @@ class Coregistration(object):
         return (self._has_mri_data and
                 len(self._nearest_transformed_high_res_mri_idx_hsp) > 0)
 
-    @property
-    def _orig_hsp_point_distance(self):
-        mri_points = self._transformed_high_res_mri_points[
-            self._nearest_transformed_high_res_mri_idx_orig_hsp]
-        hsp_points = self._transformed_orig_dig_extra
-        return np.linalg.norm(mri_points - hsp_points, axis=-1)
+    def _weighted_dig_mri_error(self):
+        head_pts, mri_pts, weights = self._setup_icp(0)
+        head_pts = apply_trans(self._head_mri_t, head_pts)
+        return np.dot(weights, np.sum((mri_pts - head_pts) ** 2, axis=1))
 
     def _log_dig_mri_distance(self, prefix):
         errs_nearest = self.compute_dig_mri_distances()
         logger.info(f'{prefix} median distance: '
                     f'{np.median(errs_nearest * 1000):6.2f} mm')
+        return errs_nearest
 
     @verbose
     def fit_fiducials(self, lpa_weight=1., nasion_weight=10., rpa_weight=1.,
@@ -1712,44 +1808,62 @@ class Coregistration(object):
         self._log_dig_mri_distance('End  ')
         return self
 
-    def _setup_icp(self, n_scale_params):
+    def _setup_icp(self, n_scale_params, normals=False):
         head_pts = list()
         mri_pts = list()
         weights = list()
+        nn = list()
+        if normals:
+            mri_nn = self._get_transformed_high_res_mri_nn()
         if self._has_dig_data and self._hsp_weight > 0:  # should be true
+            idx = self._nearest_transformed_high_res_mri_idx_hsp
             head_pts.append(self._filtered_extra_points)
-            mri_pts.append(self._processed_high_res_mri_points[
-                self._nearest_transformed_high_res_mri_idx_hsp])
+            mri_pts.append(self._processed_high_res_mri_points[idx])
+            if normals:
+                nn.append(mri_nn[idx])
             weights.append(np.full(len(head_pts[-1]), self._hsp_weight))
         for key in ('lpa', 'nasion', 'rpa'):
             if getattr(self, f'_has_{key}_data'):
-                head_pts.append(self._dig_dict[key])
                 if self._icp_fid_match == 'matched':
+                    head_pts.append(self._dig_dict[key])
                     mri_pts.append(getattr(self, f'_{key}'))
+                    if normals:
+                        # a matched point is not on the surface, so constrain
+                        # it along all three axes (point-to-point)
+                        head_pts[-1] = np.repeat(head_pts[-1], 3, axis=0)
+                        mri_pts[-1] = np.repeat(mri_pts[-1], 3, axis=0)
+                        nn.append(np.eye(3))
                 else:
                     assert self._icp_fid_match == 'nearest'
-                    mri_pts.append(self._processed_high_res_mri_points[
-                        getattr(
-                            self,
-                            '_nearest_transformed_high_res_mri_idx_%s'
-                            % (key,))])
+                    idx = getattr(
+                        self, f'_nearest_transformed_high_res_mri_idx_{key}')
+                    head_pts.append(self._dig_dict[key])
+                    mri_pts.append(self._processed_high_res_mri_points[idx])
+                    if normals:
+                        nn.append(mri_nn[idx])
                 weights.append(np.full(len(mri_pts[-1]),
                                        getattr(self, '_%s_weight' % key)))
         if self._has_eeg_data and self._eeg_weight > 0:
+            idx = self._nearest_transformed_high_res_mri_idx_eeg
             head_pts.append(self._dig_dict['dig_ch_pos_location'])
-            mri_pts.append(self._processed_high_res_mri_points[
-                self._nearest_transformed_high_res_mri_idx_eeg])
+            mri_pts.append(self._processed_high_res_mri_points[idx])
+            if normals:
+                nn.append(mri_nn[idx])
             weights.append(np.full(len(mri_pts[-1]), self._eeg_weight))
         if self._has_hpi_data and self._hpi_weight > 0:
+            idx = self._nearest_transformed_high_res_mri_idx_hpi
             head_pts.append(self._dig_dict['hpi'])
-            mri_pts.append(self._processed_high_res_mri_points[
-                self._nearest_transformed_high_res_mri_idx_hpi])
+            mri_pts.append(self._processed_high_res_mri_points[idx])
+            if normals:
+                nn.append(mri_nn[idx])
             weights.append(np.full(len(mri_pts[-1]), self._hpi_weight))
         head_pts = np.concatenate(head_pts)
         mri_pts = np.concatenate(mri_pts)
         weights = np.concatenate(weights)
         if n_scale_params == 0:
             mri_pts *= self._scale  # not done in fit_matched_points
+        if normals:
+            return head_pts, mri_pts, weights, np.concatenate(nn)
         return head_pts, mri_pts, weights
 
     def set_fid_match(self, match):
@@ -1773,7 +1887,8 @@ class Coregistration(object):
 
     @verbose
     def fit_icp(self, n_iterations=20, lpa_weight=1., nasion_weight=10.,
-                rpa_weight=1., verbose=None):
+                rpa_weight=1., method='point-to-point', accel=None,
+                tol=1e-6, verbose=None):
         """Find MRI scaling, translation, and rotation to match HSP.
 
         Parameters
@@ -1786,6 +1901,28 @@ class Coregistration(object):
             Relative weight for nasion. The default value is 10.
         rpa_weight : float
             Relative weight for RPA. The default value is 1.
+        method : str
+            The ICP error metric. Can be ``'point-to-point'`` (default), which
+            minimizes the distances to the nearest MRI surface points, or
+            ``'point-to-plane'``, which minimizes the distances to the planes
+            tangent to the MRI surface at those points and typically needs
+            fewer iterations to converge.
+
+            .. versionadded:: 0.24
+        accel : None | str
+            Can be ``'anderson'`` to extrapolate the parameters from the
+            last iterations using Anderson acceleration. The extrapolated
+            parameters are only used when they reduce the weighted squared
+            distances. Defaults to None (no acceleration).
+
+            .. versionadded:: 0.24
+        tol : float | None
+            Stop iterating once the mean distance between the digitization
+            points and the MRI surface changes by less than this value (in
+            m) between iterations. None disables this check. Defaults to
+            1e-6.
+
+            .. versionadded:: 0.24
         %(verbose)s
 
         Returns
@@ -1793,37 +1930,109 @@ class Coregistration(object):
         self : Coregistration
             The modified Coregistration object.
         """
+        _check_option('method', method, ('point-to-point', 'point-to-plane'))
+        _check_option('accel', accel, (None, 'anderson'))
         logger.info('Aligning using ICP')
-        self._log_dig_mri_distance('Start    ')
+        last_mean = np.mean(self._log_dig_mri_distance('Start    '))
         n_scale_params = self._n_scale_params
         self._lpa_weight = lpa_weight
         self._nasion_weight = nasion_weight
         self._rpa_weight = rpa_weight
 
         # Initial guess (current state)
-        est = self._parameters
-        est = est[:[6, 7, None, 9][n_scale_params]]
+        n_params = [6, 7, None, 9][n_scale_params]
+        est = self._parameters[:n_params]
+        if accel == 'anderson':
+            # the last K parameters and their (plain) ICP updates
+            K = 5
+            last_K_params = deque(maxlen=K)
+            last_K_updates = deque(maxlen=K)
+
+        damping = 0.
 
         # Do the fits, assigning and evaluating at each step
         for ii in range(n_iterations):
-            head_pts, mri_pts, weights = self._setup_icp(n_scale_params)
-            est = fit_matched_points(mri_pts, head_pts, scale=n_scale_params,
-                                     x0=est, out='params', weights=weights)
-            if n_scale_params == 0:
-                self._update_params(rot=est[:3], tra=est[3:6])
-            elif n_scale_params == 1:
-                est = np.array(list(est) + [est[-1]] * 2)
-                self._update_params(rot=est[:3], tra=est[3:6], sca=est[6:9])
+            last_params = (self._rotation, self._translation, self._scale)
+            if method == 'point-to-point':
+                head_pts, mri_pts, weights = self._setup_icp(n_scale_params)
+                est = fit_matched_points(
+                    mri_pts, head_pts, scale=n_scale_params, x0=est,
+                    out='params', weights=weights)
+                est = self._set_icp_params(est, n_scale_params)
             else:
-                self._update_params(rot=est[:3], tra=est[3:6], sca=est[6:9])
+                # the linearized step can overshoot when the surface barely
+                # constrains it, so only accept steps that reduce the error
+                # and damp the rejected ones more strongly
+                head_pts, mri_pts, weights, nn = self._setup_icp(
+                    n_scale_params, normals=True)
+                err = self._weighted_dig_mri_error()
+                for _ in range(10):
+                    try:
+                        new_est = _fit_point_to_plane(
+                            mri_pts, head_pts, nn, weights, n_scale_params,
+                            est, damping)
+                    except np.linalg.LinAlgError:
+                        pass
+                    else:
+                        new_est = self._set_icp_params(new_est, n_scale_params)
+                        if self._weighted_dig_mri_error() <= err:
+                            est = new_est
+                            damping /= 10.
+                            break
+                        self._update_params(*last_params)
+                    damping = max(10. * damping, 1e-3)
+                (self._last_rotation, self._last_translation,
+                 self._last_scale) = last_params
+            # using Anderson acceleration of the parameters for faster
+            # convergence
+            if accel == 'anderson':
+                last_K_params.append(np.concatenate(last_params))
+                last_K_updates.append(self._parameters)
+                params_acc = None
+                if len(last_K_params) > 1:
+                    params_acc = _anderson_extrapolate(
+                        np.array(last_K_params), np.array(last_K_updates))
+                    if params_acc is None:
+                        # the residuals can be linearly dependent, in which
+                        # case we just proceed with the plain ICP step
+                        logger.debug(f'Iteration {ii + 1}: LinAlg Error')
+                if params_acc is not None:
+                    # only keep the extrapolated parameters when they
+                    # reduce the error of the plain ICP step
+                    err = self._weighted_dig_mri_error()
+                    params = self._parameters
+                    params_acc = self._set_icp_params(
+                        params_acc[:n_params], n_scale_params)
+                    if self._weighted_dig_mri_error() < err:
+                        est = params_acc
+                    else:
+                        logger.debug(f'Iteration {ii + 1}: Anderson step '
+                                     'rejected')
+                        est = self._set_icp_params(
+                            params[:n_params], n_scale_params)
+                (self._last_rotation, self._last_translation,
+                 self._last_scale) = last_params
             angle, move, scale = self._changes
-            self._log_dig_mri_distance(f'  ICP {ii + 1:2d} ')
+            mean = np.mean(self._log_dig_mri_distance(f'  ICP {ii + 1:2d} '))
             if angle <= self._icp_angle and move <= self._icp_distance and \
                     all(scale <= self._icp_scale):
                 break
+            if tol is not None and abs(last_mean - mean) < tol:
+                break
+            last_mean = mean
         self._log_dig_mri_distance('End      ')
         return self
 
+    def _set_icp_params(self, est, n_scale_params):
+        if n_scale_params == 0:
+            self._update_params(rot=est[:3], tra=est[3:6])
+        elif n_scale_params == 1:
+            est = np.array(list(est) + [est[-1]] * 2)
+            self._update_params(rot=est[:3], tra=est[3:6], sca=est[6:9])
+        else:
+            self._update_params(rot=est[:3], tra=est[3:6], sca=est[6:9])
+        return est
+
     @property
     def _n_scale_params(self):
         if self._scale_mode is None:
@@ -1857,9 +2066,9 @@ class Coregistration(object):
         n_excluded = np.sum(~mask)
         logger.info("Coregistration: Excluding %i head shape points with "
                     "distance >= %.3f m.", n_excluded, distance)
-        # set the filter
-        self._extra_points_filter = mask
-        self._update_params(force_update_omitted=True)
+        # set the filter (the nearest MRI points of the remaining head shape
+        # points are already known, so nothing needs to be recomputed)
+        self._set_extra_points_filter(mask)
         return self
 
     def compute_dig_mri_distances(self):
@@ -1878,7 +2087,8 @@ class Coregistration(object):
         # faster to use our already-determined nearest points
         hsp_points, mri_points, _ = self._setup_icp(0)
         hsp_points = apply_trans(self._head_mri_t, hsp_points)
-        return np.linalg.norm(mri_points - hsp_points, axis=-1)
+        hsp_points -= mri_points
+        return np.linalg.norm(hsp_points, axis=-1)
 
     @property
     def trans(self):
@@ -1900,6 +2110,6 @@ class Coregistration(object):
         self._last_rotation = self._rotation.copy()
         self._last_translation = self._translation.copy()
         self._last_scale = self._scale.copy()
-        self._extra_points_filter = None
+        self._set_extra_points_filter(None)
         self._update_nearest_calc()
         return self
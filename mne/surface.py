@@ -528,7 +528,7 @@ class _DistanceQuery(object):
             except ImportError:
                 method = 'cdist'
             else:
-                self.query = cKDTree(xhs).query
+                self.query = partial(_safe_query, func=cKDTree(xhs).query)
 
         # KDTree is really only faster for huge (~100k) sets,
         # (e.g., with leafsize=2048), and it's slower for small (~5k)
@@ -1,8 +1,7 @@
-from functools import reduce
 from glob import glob
 import os
 import os.path as op
-from shutil import copyfile, copytree
+from shutil import copyfile, copytree, move, rmtree
 
 import pytest
 import numpy as np
@@ -18,13 +17,23 @@ from mne.coreg import (fit_matched_points, create_default_subject, scale_mri,
                        _is_mri_subject, scale_labels, scale_source_space,
                        coregister_fiducials, get_mni_fiducials, Coregistration)
 from mne.io import read_fiducials, read_info
+from mne._freesurfer import _read_talxfm_cached, _read_talxfm_mtimes
 from mne.io.constants import FIFF
-from mne.utils import requires_nibabel, modified_env, check_version
+from mne.utils import (requires_nibabel, modified_env, check_version,
+                       catch_logging)
 from mne.source_space import write_source_spaces
 
 data_path = testing.data_path(download=False)
 subjects_dir = os.path.join(data_path, 'subjects')
 fid_fname = op.join(subjects_dir, 'sample', 'bem', 'sample-fiducials.fif')
+fname_raw = op.join(op.dirname(__file__), '..', 'io', 'tests', 'data',
+                    'test_raw.fif')
+
+
+@pytest.fixture(scope='module')
+def coreg_base_info():
+    """Read the measurement info once for all test_coregistration runs."""
+    return read_info(fname_raw)
 
 
 @pytest.fixture
@@ -59,15 +68,12 @@ def test_coregister_fiducials():
     assert_array_almost_equal(trans_est['trans'], trans['trans'])
 
 
-@requires_nibabel()
-@pytest.mark.slowtest  # can take forever on OSX Travis
-@testing.requires_testing_data
-@pytest.mark.parametrize('scale', (.9, [1, .2, .8]))
-def test_scale_mri(tmpdir, few_surfaces, scale):
-    """Test creating fsaverage and scaling it."""
+@pytest.fixture(scope='module')
+def scale_mri_subjects_dir(tmpdir_factory):
+    """Create fsaverage with source spaces once for all test_scale_mri runs."""
     # create fsaverage using the testing "fsaverage" instead of the FreeSurfer
     # one
-    tempdir = str(tmpdir)
+    tempdir = str(tmpdir_factory.mktemp('scale_mri'))
     fake_home = testing.data_path()
     create_default_subject(subjects_dir=tempdir, fs_home=fake_home,
                            verbose=True)
@@ -86,11 +92,17 @@ def test_scale_mri(tmpdir, few_surfaces, scale):
     path_to = op.join(tempdir, 'fsaverage', 'mri', 'orig.mgz')
     copyfile(path_from, path_to)
 
-    # remove redundant label files
-    label_temp = op.join(tempdir, 'fsaverage', 'label', '*.label')
-    label_paths = glob(label_temp)
-    for label_path in label_paths[1:]:
-        os.remove(label_path)
+    # remove redundant label files (all but one) by moving what we keep to
+    # a fresh directory and deleting the old one in one go
+    label_dir = op.join(tempdir, 'fsaverage', 'label')
+    old_label_dir = label_dir + '_old'
+    os.rename(label_dir, old_label_dir)
+    os.mkdir(label_dir)
+    keep = [op.basename(glob(op.join(old_label_dir, '*.label'))[0])]
+    keep += [f for f in os.listdir(old_label_dir) if not f.endswith('.label')]
+    for fname in keep:
+        move(op.join(old_label_dir, fname), op.join(label_dir, fname))
+    rmtree(old_label_dir)
 
     # create source space
     print('Creating surface source space')
@@ -104,6 +116,32 @@ def test_scale_mri(tmpdir, few_surfaces, scale):
         add_interpolator=False)
     write_source_spaces(path % 'vol-50', vsrc)
 
+    # add distances to source space after hacking the properties to make
+    # it run *much* faster
+    src_dist = src.copy()
+    for s in src_dist:
+        s.update(rr=s['rr'][s['vertno']], nn=s['nn'][s['vertno']],
+                 tris=s['use_tris'])
+        s.update(np=len(s['rr']), ntri=len(s['tris']),
+                 vertno=np.arange(len(s['rr'])),
+                 inuse=np.ones(len(s['rr']), int))
+    mne.add_source_space_distances(src_dist)
+    return tempdir, src, vsrc, src_dist
+
+
+@requires_nibabel()
+@pytest.mark.slowtest  # can take forever on OSX Travis
+@testing.requires_testing_data
+@pytest.mark.parametrize('scale', (.9, [1, .2, .8]),
+                         ids=('uniform', '3-axis'))
+def test_scale_mri(tmpdir, few_surfaces, scale_mri_subjects_dir, scale):
+    """Test creating fsaverage and scaling it."""
+    # each run scales its own copy of the shared fsaverage
+    base_dir, src, vsrc, src_dist = scale_mri_subjects_dir
+    tempdir = str(tmpdir)
+    copytree(op.join(base_dir, 'fsaverage'), op.join(tempdir, 'fsaverage'))
+    path = op.join(tempdir, 'fsaverage', 'bem', 'fsaverage-%s-src.fif')
+
     # scale fsaverage
     write_source_spaces(path % 'ico-0', src, overwrite=True)
     with pytest.warns(None):  # sometimes missing nibabel
@@ -116,25 +154,16 @@ def test_scale_mri(tmpdir, few_surfaces, scale):
     assert os.path.isfile(os.path.join(tempdir, 'flachkopf', 'surf',
                                        'lh.sphere.reg'))
     vsrc_s = mne.read_source_spaces(spath % 'vol-50')
-    for vox in ([0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 2, 3]):
-        idx = np.ravel_multi_index(vox, vsrc[0]['shape'], order='F')
-        err_msg = f'idx={idx} @ {vox}, scale={scale}'
-        assert_allclose(apply_trans(vsrc[0]['src_mri_t'], vox),
-                        vsrc[0]['rr'][idx], err_msg=err_msg)
-        assert_allclose(apply_trans(vsrc_s[0]['src_mri_t'], vox),
-                        vsrc_s[0]['rr'][idx], err_msg=err_msg)
+    vox = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 2, 3]])
+    idx = np.ravel_multi_index(vox.T, vsrc[0]['shape'], order='F')
+    err_msg = f'idx={idx} @ {vox.tolist()}, scale={scale}'
+    assert_allclose(apply_trans(vsrc[0]['src_mri_t'], vox),
+                    vsrc[0]['rr'][idx], err_msg=err_msg)
+    assert_allclose(apply_trans(vsrc_s[0]['src_mri_t'], vox),
+                    vsrc_s[0]['rr'][idx], err_msg=err_msg)
     scale_labels('flachkopf', subjects_dir=tempdir)
 
-    # add distances to source space after hacking the properties to make
-    # it run *much* faster
-    src_dist = src.copy()
-    for s in src_dist:
-        s.update(rr=s['rr'][s['vertno']], nn=s['nn'][s['vertno']],
-                 tris=s['use_tris'])
-        s.update(np=len(s['rr']), ntri=len(s['tris']),
-                 vertno=np.arange(len(s['rr'])),
-                 inuse=np.ones(len(s['rr']), int))
-    mne.add_source_space_distances(src_dist)
+    src_dist = src_dist.copy()  # modified below
     write_source_spaces(path % 'ico-0', src_dist, overwrite=True)
 
     # scale with distances
@@ -254,8 +283,9 @@ def test_fit_matched_points():
                               "rotation and translation.")
 
     # rotation & translation & scaling
-    trans = reduce(np.dot, (translation(2, -6, 3), rotation(1.5, .3, 1.4),
-                            scaling(.5, .5, .5)))
+    trans = np.linalg.multi_dot([translation(2, -6, 3),
+                                 rotation(1.5, .3, 1.4),
+                                 scaling(.5, .5, .5)])
     src_pts = apply_trans(trans, tgt_pts)
     trans_est = fit_matched_points(src_pts, tgt_pts, scale=1, out='trans')
     est_pts = apply_trans(trans_est, src_pts)
@@ -269,7 +299,7 @@ def test_fit_matched_points():
 
 @testing.requires_testing_data
 @requires_nibabel()
-def test_get_mni_fiducials():
+def test_get_mni_fiducials(tmp_path):
     """Test get_mni_fiducials."""
     fids, coord_frame = read_fiducials(fid_fname)
     assert coord_frame == FIFF.FIFFV_COORD_MRI
@@ -279,36 +309,159 @@ def test_get_mni_fiducials():
     fids_est = np.array([f['r'] for f in fids_est])
     dists = np.linalg.norm(fids - fids_est, axis=-1) * 1000.  # -> mm
     assert (dists < 8).all(), dists
+    # a second call reuses the transform and gives the same result
+    cache_info = _read_talxfm_mtimes.cache_info
+    hits = cache_info().hits
+    fids_est_2 = get_mni_fiducials('sample', subjects_dir)
+    assert cache_info().hits == hits + 1
+    assert_allclose([f['r'] for f in fids_est_2], fids_est)
+    # modifying talairach.xfm invalidates the cached transform
+    mri_dir = op.join(subjects_dir, 'sample', 'mri')
+    tmp_mri_dir = tmp_path / 'sample' / 'mri'
+    os.makedirs(tmp_mri_dir / 'transforms')
+    xfm_fname = str(tmp_mri_dir / 'transforms' / 'talairach.xfm')
+    copyfile(op.join(mri_dir, 'transforms', 'talairach.xfm'), xfm_fname)
+    for fname in ('orig.mgz', 'T1.mgz'):
+        if op.isfile(op.join(mri_dir, fname)):
+            copyfile(op.join(mri_dir, fname), str(tmp_mri_dir / fname))
+    misses = cache_info().misses
+    _read_talxfm_cached('sample', tmp_path)
+    _read_talxfm_cached('sample', tmp_path)
+    assert cache_info().misses == misses + 1
+    mtime = op.getmtime(xfm_fname) + 10
+    os.utime(xfm_fname, (mtime, mtime))
+    _read_talxfm_cached('sample', tmp_path)
+    assert cache_info().misses == misses + 2
+
+
+@testing.requires_testing_data
+def test_coregistration_set_scale(coreg_base_info):
+    """Test that scaling updates the nearest MRI points."""
+    from scipy.spatial import cKDTree
+    coreg = Coregistration(coreg_base_info, subject='sample',
+                           subjects_dir=subjects_dir)
+    coreg.fit_fiducials()
+    coreg.set_scale([1.15] * 3)
+    hsp = apply_trans(coreg._head_mri_t, coreg._dig_dict['hsp'])
+    dist = cKDTree(coreg._processed_high_res_mri_points * 1.15).query(hsp)[0]
+    assert_allclose(coreg.compute_dig_mri_distances()[:len(hsp)], dist,
+                    atol=1e-12)
+    coreg.omit_head_shape_points(0.005)
+    assert len(coreg._filtered_extra_points) == np.sum(dist <= 0.005)
+    assert len(coreg._filtered_extra_points) < len(hsp)
+
+
+@testing.requires_testing_data
+def test_coregistration_no_eeg(coreg_base_info):
+    """Test coregistration without EEG digitization points."""
+    info = coreg_base_info.copy()
+    info['dig'] = [d for d in info['dig']
+                   if d['kind'] != FIFF.FIFFV_POINT_EEG]
+    coreg = Coregistration(info, subject='sample', subjects_dir=subjects_dir)
+    assert not coreg._has_eeg_data
+    coreg.fit_fiducials()
+    coreg.fit_icp()
+    errs = coreg.compute_dig_mri_distances()
+    assert 0.001 < np.median(errs) < 0.004
+
+
+@testing.requires_testing_data
+@pytest.mark.parametrize('scale_mode', (None, 'uniform', '3-axis'))
+@pytest.mark.parametrize('method', ('point-to-point', 'point-to-plane'))
+def test_coregistration_anderson(coreg_base_info, scale_mode, method,
+                                 monkeypatch):
+    """Test that bad Anderson extrapolations are rejected."""
+    coreg = Coregistration(coreg_base_info, subject='sample',
+                           subjects_dir=subjects_dir)
+    coreg.set_scale_mode(scale_mode)
+    coreg.fit_fiducials()
+    params = coreg._parameters
+    coreg.fit_icp(method=method)
+    params_plain = coreg._parameters
+
+    # extrapolations that move away from the plain ICP step increase the
+    # error, so they are all rejected and the fit follows the plain one
+    calls = list()
+
+    def _bad_extrapolate(params, updates):
+        calls.append(len(params))
+        params_acc = updates[-1].copy()
+        params_acc[3:6] += 0.01
+        return params_acc
+
+    monkeypatch.setattr(mne.coreg, '_anderson_extrapolate', _bad_extrapolate)
+    coreg.set_scale(params[6:9])
+    coreg.set_rotation(params[:3])
+    coreg.set_translation(params[3:6])
+    coreg.fit_icp(method=method, accel='anderson')
+    assert len(calls) > 0  # extrapolated with the default stop criteria
+    assert_array_equal(coreg._parameters, params_plain)
+
+
+@testing.requires_testing_data
+def test_coregistration_tol(coreg_base_info):
+    """Test the tolerance of the ICP iterations."""
+    coreg = Coregistration(coreg_base_info, subject='sample',
+                           subjects_dir=subjects_dir)
+    coreg.fit_fiducials()
+    # disable the parameter change criteria so only tol can stop early
+    coreg._icp_angle = coreg._icp_distance = coreg._icp_scale = -1.
+    params = coreg._parameters
+    with catch_logging() as log:
+        coreg.fit_icp(n_iterations=3, tol=None, verbose=True)
+    assert log.getvalue().count('  ICP ') == 3
+    coreg.set_rotation(params[:3])
+    coreg.set_translation(params[3:6])
+    with catch_logging() as log:
+        coreg.fit_icp(n_iterations=3, tol=1., verbose=True)
+    assert log.getvalue().count('  ICP ') == 1
 
 
 @testing.requires_testing_data
 @pytest.mark.parametrize(
-    'scale_mode,ref_scale,grow_hair,fiducials,fid_match', [
-        (None, [1., 1., 1.], 0., None, 'nearest'),
-        (None, [1., 1., 1.], 0., 'estimated', 'nearest'),
-        (None, [1., 1., 1.], 2., 'auto', 'nearest'),
-        ('uniform', [1., 1., 1.], 0., None, 'nearest'),
-        ('3-axis', [1., 1., 1.], 0., 'auto', 'nearest'),
-        ('uniform', [0.8, 0.8, 0.8], 0., 'auto', 'nearest'),
-        ('3-axis', [0.8, 1.2, 1.2], 0., 'auto', 'matched')])
-def test_coregistration(scale_mode, ref_scale, grow_hair, fiducials,
-                        fid_match):
+    'scale_mode,ref_scale,grow_hair,fiducials,fid_match,method,accel', [
+        (None, [1., 1., 1.], 0., None, 'nearest', 'point-to-point', None),
+        (None, [1., 1., 1.], 0., 'estimated', 'nearest', 'point-to-point',
+         None),
+        (None, [1., 1., 1.], 2., 'auto', 'nearest', 'point-to-point', None),
+        ('uniform', [1., 1., 1.], 0., None, 'nearest', 'point-to-point',
+         None),
+        ('3-axis', [1., 1., 1.], 0., 'auto', 'nearest', 'point-to-point',
+         None),
+        ('uniform', [0.8, 0.8, 0.8], 0., 'auto', 'nearest', 'point-to-point',
+         None),
+        ('3-axis', [0.8, 1.2, 1.2], 0., 'auto', 'matched', 'point-to-point',
+         None),
+        (None, [1., 1., 1.], 2., 'auto', 'nearest', 'point-to-point',
+         'anderson'),
+        ('3-axis', [0.8, 1.2, 1.2], 0., 'auto', 'matched', 'point-to-point',
+         'anderson'),
+        (None, [1., 1., 1.], 0., None, 'nearest', 'point-to-plane', None),
+        (None, [0.9, 1.1, 1.05], 0., 'auto', 'nearest', 'point-to-plane',
+         None),
+        ('3-axis', [0.8, 1.2, 1.2], 0., 'auto', 'matched', 'point-to-plane',
+         None),
+        ('uniform', [0.8, 0.8, 0.8], 0., 'auto', 'nearest', 'point-to-plane',
+         'anderson')])
+def test_coregistration(coreg_base_info, scale_mode, ref_scale, grow_hair,
+                        fiducials, fid_match, method, accel):
     """Test automated coregistration."""
     trans_fname = op.join(data_path, 'MEG', 'sample',
                           'sample_audvis_trunc-trans.fif')
-    fname_raw = op.join(op.dirname(__file__), '..', 'io',
-                        'tests', 'data', 'test_raw.fif')
     subject = 'sample'
     if fiducials is None:
         fiducials, coord_frame = read_fiducials(fid_fname)
         assert coord_frame == FIFF.FIFFV_COORD_MRI
-    info = read_info(fname_raw)
-    for d in info['dig']:
-        d['r'] = d['r'] * ref_scale
+    info = coreg_base_info.copy()
+    dig_rr = np.array([d['r'] for d in info['dig']]) * ref_scale
+    for d, r in zip(info['dig'], dig_rr):
+        d['r'] = r
     trans = read_trans(trans_fname)
     coreg = Coregistration(info, subject=subject, subjects_dir=subjects_dir,
                            fiducials=fiducials)
     assert np.allclose(coreg._last_parameters, coreg._parameters)
+    # the cached head surface is shared, so it must not be modifiable
+    assert not coreg._bem_high_res['rr'].flags.writeable
     coreg.set_fid_match(fid_match)
     default_params = list(coreg._default_parameters)
     coreg.set_rotation(default_params[:3])
@@ -319,7 +472,7 @@ def test_coregistration(scale_mode, ref_scale, grow_hair, fiducials,
     # Identity transform
     errs_id = coreg.compute_dig_mri_distances()
     is_scaled = ref_scale != [1., 1., 1.]
-    id_max = 0.03 if is_scaled and scale_mode == '3-axis' else 0.02
+    id_max = 0.03 if is_scaled and scale_mode != 'uniform' else 0.02
     assert 0.005 < np.median(errs_id) < id_max
     # Fiducial transform + scale
     coreg.fit_fiducials(verbose=True)
@@ -341,23 +494,25 @@ def test_coregistration(scale_mode, ref_scale, grow_hair, fiducials,
     coreg.omit_head_shape_points(distance=5. / 1000)
     assert coreg._extra_points_filter is not None
     # ICP transform + scale
-    coreg.fit_icp(verbose=True)
+    coreg.fit_icp(method=method, accel=accel, verbose=True)
     assert isinstance(coreg.trans, Transform)
     errs_icp = coreg.compute_dig_mri_distances()
     assert_array_less(0, errs_icp)
-    if is_scaled or scale_mode == '3-axis':
-        icp_max = 0.015
+    if is_scaled and scale_mode is None:
+        # the MRI cannot match the head shape, but the fit must stay close
+        icp_max, icp_med = 0.02, 0.008
+    elif is_scaled or scale_mode == '3-axis':
+        icp_max, icp_med = 0.015, 0.004
     else:
-        icp_max = 0.01
+        icp_max, icp_med = 0.01, 0.004
     assert_array_less(errs_icp, icp_max)
-    assert 0.001 < np.median(errs_icp) < 0.004
+    assert 0.001 < np.median(errs_icp) < icp_med
     assert np.rad2deg(_angle_between_quats(
         rot_to_quat(coreg.trans['trans'][:3, :3]),
         rot_to_quat(trans['trans'][:3, :3]))) < 13
     if scale_mode is None:
-        atol = 1e-7
+        assert_array_equal(coreg._scale, 1.)
     else:
-        atol = 0.35
-    assert_allclose(coreg._scale, ref_scale, atol=atol)
+        assert_allclose(coreg._scale, ref_scale, atol=0.35)
     coreg.reset()
     assert_allclose(coreg._parameters, default_params)
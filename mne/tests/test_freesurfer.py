@@ -9,7 +9,8 @@ from mne import (vertex_to_mni, head_to_mni,
                  read_talxfm, read_freesurfer_lut,
                  get_volume_labels_from_aseg)
 from mne.datasets import testing
-from mne._freesurfer import _get_mgz_header, _check_subject_dir
+from mne._freesurfer import (_get_mgz_header, _check_subject_dir,
+                             _read_surface_rr_mtime, _read_talxfm_mtimes)
 from mne.transforms import apply_trans, _get_trans
 from mne.utils import requires_nibabel
 
@@ -53,6 +54,15 @@ def test_vertex_to_mni():
     coords_2 = vertex_to_mni(vertices, hemis, 'sample', subjects_dir)
     # less than 1mm error
     assert_allclose(coords, coords_2, atol=1.0)
+    # the white surfaces are cached and read-only
+    cache_info = _read_surface_rr_mtime.cache_info
+    hits = cache_info().hits
+    coords_3 = vertex_to_mni(vertices, hemis, 'sample', subjects_dir)
+    assert cache_info().hits == hits + 2
+    assert_allclose(coords_3, coords_2)
+    fname = op.join(subjects_dir, 'sample', 'surf', 'lh.white')
+    rr = _read_surface_rr_mtime(fname, op.getmtime(fname))
+    assert not rr.flags.writeable
 
 
 @testing.requires_testing_data
@@ -87,6 +97,8 @@ def test_vertex_to_mni_fs_nibabel(monkeypatch):
     vertices = rng.randint(0, 100000, n_check)
     hemis = rng.randint(0, 1, n_check)
     coords = vertex_to_mni(vertices, hemis, subject, subjects_dir)
+    # make sure the transform is read again
+    _read_talxfm_mtimes.cache_clear()
     read_mri = mne._freesurfer._read_mri_info
     monkeypatch.setattr(
         mne._freesurfer, '_read_mri_info',
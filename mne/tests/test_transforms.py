@@ -117,6 +117,13 @@ def test_get_ras_to_neuromag_trans():
     err = "Neuromag transformation failed"
     assert_allclose(pts_restored, pts, atol=1e-6, err_msg=err)
 
+    # transforming into a preallocated array
+    out = np.empty(pts.shape)
+    assert apply_trans(hsp_trans, pts_changed, out=out) is out
+    assert_allclose(out, pts_restored)
+    out = np.empty((0, 3))
+    assert apply_trans(hsp_trans, np.empty((0, 3)), out=out) is out
+
 
 def _cartesian_to_sphere(x, y, z):
     """Convert using old function."""
@@ -213,7 +213,7 @@ def _find_trans(subject, subjects_dir=None):
     return trans_fnames[0]
 
 
-def apply_trans(trans, pts, move=True):
+def apply_trans(trans, pts, move=True, out=None):
     """Apply a transform matrix to an array of points.
 
     Parameters
@@ -224,6 +224,11 @@ def apply_trans(trans, pts, move=True):
         Array with coordinates for one or n points.
     move : bool
         If True (default), apply translation.
+    out : None | array, shape = (3,) | (n, 3)
+        A C-contiguous float64 array with the same shape as ``pts`` in which
+        to store the result. If None (default), a new array is allocated.
+
+        .. versionadded:: 0.24
 
     Returns
     -------
@@ -234,10 +239,10 @@ def apply_trans(trans, pts, move=True):
         trans = trans['trans']
     pts = np.asarray(pts)
     if pts.size == 0:
-        return pts.copy()
+        return pts.copy() if out is None else out
 
     # apply rotation & scale
-    out_pts = np.dot(pts, trans[:3, :3].T)
+    out_pts = np.dot(pts, trans[:3, :3].T, out=out)
     # apply translation
     if move:
         out_pts += trans[:3, 3]